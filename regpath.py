@@ -1,4 +1,7 @@
+import collections
+import contextlib
 import enum
+import threading
 import typing
 import weakref
 import winreg
@@ -41,6 +44,27 @@ class Access(enum.IntFlag):
     ALL_ACCESS = winreg.KEY_ALL_ACCESS
 
 
+# Plain ints for internal calls, avoids IntFlag/IntEnum overhead
+_KEY_READ = winreg.KEY_READ
+_REG_SZ = winreg.REG_SZ
+_REG_DWORD = winreg.REG_DWORD
+_REG_QWORD = winreg.REG_QWORD
+_REG_MULTI_SZ = winreg.REG_MULTI_SZ
+
+# winreg functions used on hot paths, bound once
+_OpenKeyEx = winreg.OpenKeyEx
+_CreateKeyEx = winreg.CreateKeyEx
+_ConnectRegistry = winreg.ConnectRegistry
+_CloseKey = winreg.CloseKey
+_QueryInfoKey = winreg.QueryInfoKey
+_EnumKey = winreg.EnumKey
+_EnumValue = winreg.EnumValue
+_SetValueEx = winreg.SetValueEx
+_QueryValueEx = winreg.QueryValueEx
+_DeleteKey = winreg.DeleteKey
+_DeleteValue = winreg.DeleteValue
+
+
 class Type(enum.IntEnum):
     BINARY = winreg.REG_BINARY
 
@@ -65,35 +89,162 @@ class Type(enum.IntEnum):
     RESOURCE_REQUIREMENTS_LIST = winreg.REG_RESOURCE_REQUIREMENTS_LIST
 
 
+# Signed and unsigned values are both accepted
+_DWORD_MIN, _DWORD_MAX = -0x8000_0000, 0xffff_ffff
+_QWORD_MIN, _QWORD_MAX = -0x8000_0000_0000_0000, 0xffff_ffff_ffff_ffff
+
+_TYPE_BY_NAME = dict(Type.__members__)
+
+
 def _normalize_type(typ, value):
     if typ is None:
-        if isinstance(value, str):
+        t = type(value)
+        if t is str:
             return Type.SZ
-        if value is None:
-            return Type.NONE
-        if isinstance(value, int):
-            if -0x8000_0000 < value < 0xffff_ffff:
+
+        if t is bool:
+            return Type.DWORD
+
+        if t is int or isinstance(value, int):
+            if _DWORD_MIN <= value <= _DWORD_MAX:
                 return Type.DWORD
 
-            if -0x8000_0000_0000_0000 < value < 0xffff_ffff_ffff_ffff:
+            if _QWORD_MIN <= value <= _QWORD_MAX:
                 return Type.QWORD
 
-        elif hasattr(value, '__iter__') and all((isinstance(i, str) for i in value)):
+        elif value is None:
+            return Type.NONE
+
+        elif isinstance(value, str):
+            return Type.SZ
+
+        # Only lists and tuples are inferred as MULTI_SZ: probing any other
+        # iterable would consume it. Pass typ=Type.MULTI_SZ explicitly for those.
+        elif isinstance(value, (list, tuple)) and all(type(i) is str for i in value):
             return Type.MULTI_SZ
 
     if isinstance(typ, int):
         return typ
     if isinstance(typ, str):
-        return Type[typ]
+        return _TYPE_BY_NAME[typ]
 
     raise RuntimeError("Unknown type")
 
 
+def _close_key(key):
+    try:
+        _CloseKey(key)
+    except OSError:
+        pass
+
+
+# Whole-key enumeration, kept in one place so callers never loop over winreg themselves
+def _list_subkeys(key, count: int) -> typing.List[str]:
+    enum_key = _EnumKey
+    return [enum_key(key, i) for i in range(count)]
+
+
+def _list_values(key, count: int) -> typing.List[typing.Tuple[str, typing.Any, int]]:
+    enum_value = _EnumValue
+    return [enum_value(key, i) for i in range(count)]
+
+
+# LRU of opened but unused key handles, keyed by (remote_host, parts).
+# Handles under a pinned subtree (see RegPath.session) are not evicted.
+class _OpenKeyPool:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._keys = collections.OrderedDict()
+        self._pins = collections.Counter()
+        self._lock = threading.Lock()
+
+    def _is_pinned(self, cache_key):
+        remote_host, parts = cache_key
+        return any((remote_host, parts[:i]) in self._pins for i in range(1, len(parts) + 1))
+
+    def _evict(self):
+        if len(self._keys) <= self.maxsize:
+            return
+
+        for cache_key in list(self._keys):
+            if len(self._keys) <= self.maxsize:
+                break
+
+            if not self._is_pinned(cache_key):
+                key = self._keys.pop(cache_key, None)
+                if key is not None:
+                    _close_key(key)
+
+    def take(self, cache_key):
+        with self._lock:
+            key = self._keys.pop(cache_key, None)
+
+        # The key may have been deleted behind our back while the handle sat in the pool
+        if key is not None:
+            try:
+                _QueryInfoKey(key)
+            except OSError as e:
+                _close_key(key)
+                if e.winerror not in (2, 1018):  # File not found, key deleted
+                    raise
+                return None
+
+        return key
+
+    def put(self, cache_key, key):
+        with self._lock:
+            old = self._keys.pop(cache_key, None)
+            if old is not None:
+                _close_key(old)
+
+            self._keys[cache_key] = key
+            self._evict()
+
+    def discard(self, cache_key):
+        with self._lock:
+            key = self._keys.pop(cache_key, None)
+        if key is not None:
+            _close_key(key)
+
+    def pin(self, cache_key):
+        with self._lock:
+            self._pins[cache_key] += 1
+
+    def unpin(self, cache_key):
+        with self._lock:
+            self._pins[cache_key] -= 1
+            if self._pins[cache_key] <= 0:
+                del self._pins[cache_key]
+            self._evict()
+
+    def flush(self):
+        with self._lock:
+            while self._keys:
+                _close_key(self._keys.popitem()[1])
+
+
+_POOL = _OpenKeyPool(256)
+
+
+def flush_pool():
+    _POOL.flush()
+
+
 class RegPath:
-    __slots__ = ('_parts', '_remote_host', 'key')
-    _CACHE = weakref.WeakValueDictionary()
+    __slots__ = ('_parts', '_subpath', '_remote_host', '_hive_key', '_hive', 'key', '__weakref__')
+    # Recently used paths are held in {remote_host: {parts: RegPath}}, so a hit needs no key tuple;
+    # _LRU orders them across all hosts and only decides what to evict
+    _STRONG = {}
+    _LRU = collections.OrderedDict()  # RegPath -> None
+    _LRU_SIZE = 1024
+    _CACHE = weakref.WeakValueDictionary()  # (remote_host, parts) -> RegPath, evicted but still referenced
+    _LOCK = threading.Lock()  # guards _STRONG, _LRU and _CACHE
 
     def __new__(cls, parts: typing.Union[typing.Iterable[str], str], remote_host: typing.Optional[str] = None):
+        # Host is kept without the leading backslashes
+        if remote_host is not None and remote_host.startswith('\\'):
+            remote_host = remote_host.lstrip('\\')
+
         if isinstance(parts, str):
             parts = parts.split('\\')
 
@@ -103,7 +254,7 @@ class RegPath:
 
                 del parts[0]
                 del parts[0]
-                remote_host = '\\\\' + parts.pop(0)
+                remote_host = parts.pop(0)
 
             elif parts and not parts[0]:
                 del parts[0]
@@ -111,59 +262,148 @@ class RegPath:
             if not parts:
                 raise RuntimeError("Empty path or missing component")
 
-        parts = (HK_ALIASES.get(parts[0], parts[0]), *parts[1:])
+        first = parts[0]
+        hive_name = _HIVE_CANON.get(first)
+        if hive_name is None:
+            raise ValueError("Unknown hive {!r}".format(first))
+
+        if hive_name != first:
+            parts = (hive_name, *parts[1:])
+        elif type(parts) is not tuple:
+            parts = tuple(parts)
 
         if len(parts) == 1 and remote_host is None:
-            obj = HIVES.get(parts[0])
+            obj = HIVES.get(hive_name)
             if obj is not None:
                 return obj
 
-        obj = cls._CACHE.get((remote_host, parts))
-        if obj is not None:
+        with cls._LOCK:
+            strong = cls._STRONG.get(remote_host)
+            if strong is None:
+                strong = cls._STRONG[remote_host] = {}
+            else:
+                obj = strong.get(parts)
+                if obj is not None:
+                    cls._LRU.move_to_end(obj)
+                    return obj
+
+            cache_key = (remote_host, parts)
+            obj = cls._CACHE.get(cache_key)
+            if obj is None:
+                obj = super().__new__(cls)
+                obj._parts = parts
+                obj._subpath = '\\'.join(parts[1:])
+                obj._remote_host = remote_host
+                obj._hive_key = _HIVES[hive_name]
+                if len(parts) == 1 and remote_host is None:
+                    obj._hive = obj
+                    obj.key = obj._hive_key
+                else:
+                    obj._hive = HIVES[hive_name]
+                    obj.key = None
+                cls._CACHE[cache_key] = obj
+
+            strong[parts] = obj
+            lru = cls._LRU
+            lru[obj] = None
+            if len(lru) > cls._LRU_SIZE:
+                cls._evict(lru.popitem(last=False)[0])
             return obj
 
-        obj = super().__new__(cls)
-        obj._parts = parts
-        obj._remote_host = remote_host
-        obj.key = _HIVES[parts[0]] if len(parts) == 1 and remote_host is None else None
-        return obj
-
-    def _invoke_api(self, method, *args):
-        self.open()
-        return getattr(winreg, method)(self.key, *args)
+    @classmethod
+    def _evict(cls, obj: 'RegPath'):
+        # Called with _LOCK held, after obj has been removed from _LRU
+        strong = cls._STRONG[obj._remote_host]
+        del strong[obj._parts]
+        if not strong:
+            del cls._STRONG[obj._remote_host]
+
+        # Hand the handle to the pool so open handles stay bounded by the pool size,
+        # not by the LRU size; if obj is still in use it reopens lazily
+        obj.close()
+
+    @classmethod
+    def _lookup(cls, remote_host, parts):
+        # Existing instance for the path, if any; never creates one
+        with cls._LOCK:
+            strong = cls._STRONG.get(remote_host)
+            obj = strong.get(parts) if strong is not None else None
+            return obj if obj is not None else cls._CACHE.get((remote_host, parts))
+
+    @classmethod
+    def cache_clear(cls):
+        with cls._LOCK:
+            cls._STRONG.clear()
+            cls._LRU.clear()
+            cls._CACHE.clear()
+
+    def _invoke_api(self, func, *args):
+        if self.key is None:
+            self.open()
+        return func(self.key, *args)
 
     def delete_child(self, name: str):
-        self._invoke_api('DeleteKey', name)
+        self._invoke_api(_DeleteKey, name)
+
+        # Drop handles to the deleted key so a recreated key is never served a stale one
+        parts = self._parts + tuple(name.split('\\'))
+        _POOL.discard((self._remote_host, parts))
+        child = self._lookup(self._remote_host, parts)
+        if child is not None and child.key is not None:
+            _close_key(child.key)
+            child.key = None
 
     def open(self):
-        if self.is_opened:
+        if self.key is not None:
             return
 
-        if self.is_remote:
-            hive_key = winreg.ConnectRegistry(self.remote_host, self.hive_key)
-            if self.is_hive:
+        key = _POOL.take((self._remote_host, self._parts))
+        if key is not None:
+            self.key = key
+            return
+
+        if self._remote_host is not None:
+            hive_key = _ConnectRegistry('\\\\' + self._remote_host, self._hive_key)
+            if len(self._parts) == 1:
                 self.key = hive_key
             else:
-                self.key = getattr(winreg, 'OpenKeyEx')(hive_key, '\\'.join(self.parts[1:]), 0, Access.READ)
+                self.key = _OpenKeyEx(hive_key, self._subpath, 0, _KEY_READ)
 
         else:
-            self.key = self.hive._invoke_api('OpenKeyEx', '\\'.join(self.parts[1:]), 0, Access.READ)
+            self.key = self._hive._invoke_api(_OpenKeyEx, self._subpath, 0, _KEY_READ)
+
+    def _open_child(self, name: str) -> 'RegPath':
+        # Open relative to this (already opened) key instead of walking from the hive
+        child = self / name
+        if child.key is None:
+            self.open()  # creating child may have evicted self from the LRU
+            key = _POOL.take((child._remote_host, child._parts))
+            child.key = key if key is not None else _OpenKeyEx(self.key, name, 0, _KEY_READ)
+        return child
 
     def close(self):
-        if self.is_opened and (not self.is_hive or self.is_remote):
-            try:
-                self._invoke_api('CloseKey')
-                self.key = None
-            except OSError:
-                pass
+        if self.key is not None and (len(self._parts) > 1 or self._remote_host is not None):
+            _POOL.put((self._remote_host, self._parts), self.key)
+            self.key = None
+
+    @contextlib.contextmanager
+    def session(self):
+        cache_key = (self._remote_host, self._parts)
+        _POOL.pin(cache_key)
+        try:
+            yield self
+        finally:
+            _POOL.unpin(cache_key)
 
     # ==============================
 
     def __truediv__(self, other: str):
-        return RegPath(list(self.parts) + list(other.split('\\')), self.remote_host)
+        if '\\' not in other:
+            return RegPath(self._parts + (other,), self._remote_host)
+        return RegPath(self._parts + tuple(other.split('\\')), self._remote_host)
 
     def __repr__(self):
-        return "<RegPath '{}\\{}'>".format(('\\\\' + self.remote_host) if self.is_remote else '',
+        return "<RegPath '{}\\{}'>".format(('\\\\' + self._remote_host) if self._remote_host is not None else '',
                                            '\\'.join(self._parts))
 
     def __enter__(self):
@@ -178,7 +418,7 @@ class RegPath:
 
     @property
     def is_remote(self):
-        return self.remote_host is not None
+        return self._remote_host is not None
 
     @property
     def is_hive(self):
@@ -200,11 +440,11 @@ class RegPath:
 
     @property
     def hive(self) -> 'RegPath':
-        return HIVES[self._parts[0]]
+        return self._hive
 
     @property
     def hive_key(self):
-        return _HIVES[self._parts[0]]
+        return self._hive_key
 
     @property
     def parts(self):
@@ -216,14 +456,14 @@ class RegPath:
 
     @property
     def parent(self):
-        return RegPath(self.parts[:-1], self.remote_host)
+        return RegPath(self._parts[:-1], self._remote_host)
 
     # ==============================
     # =   Работа как с каталогом   =
     # ==============================
 
     def exists(self):
-        if self.is_opened:
+        if self.key is not None:
             return True
 
         try:
@@ -242,36 +482,44 @@ class RegPath:
         if not parents and not self.parent.exists():
             raise ValueError("Parent not exists")
 
-        self.key = self.hive._invoke_api('CreateKeyEx', '\\'.join(self.parts[1:]), 0, Access.READ)
+        self.key = self._hive._invoke_api(_CreateKeyEx, self._subpath, 0, _KEY_READ)
 
     def clear(self):
-        cc, vc, lm = self._invoke_api('QueryInfoKey')
-        for i in range(cc):
-            name = self / self._invoke_api('EnumKey', i)
-            name.rmtree()
+        self.open()
+        key = self.key
+        cc, vc, lm = _QueryInfoKey(key)
+
+        # Snapshot names first: deleting while enumerating shifts indices
+        names = _list_subkeys(key, cc)
+        value_names = [name for name, data, typ in _list_values(key, vc)]
 
-        for i in range(vc):
-            name, data, typ = self._invoke_api('EnumKey', i)
-            self.delete_value(name)
+        for name in names:
+            self._open_child(name).rmtree()
+
+        # Recursion may have evicted self from the LRU and released its handle
+        self.open()
+        key = self.key
+        delete_value = _DeleteValue
+        for name in value_names:
+            delete_value(key, name)
 
     def rmtree(self):
         self.clear()
         self.rmdir()
 
     def rmdir(self):
-        self.close()
-        self.parent.delete_child(self.name)
+        self.parent.delete_child(self._parts[-1])
 
     # ==============================
 
     def iter_names(self):
-        cc, vc, lm = self._invoke_api('QueryInfoKey')
-        for i in range(cc):
-            yield self._invoke_api('EnumKey', i)
+        self.open()
+        cc, vc, lm = _QueryInfoKey(self.key)
+        yield from _list_subkeys(self.key, cc)
 
     def iter_dir(self):
-        for i in self.iter_names():
-            yield self / i
+        for name in self.iter_names():
+            yield self / name
 
     def list_names(self):
         return list(self.iter_names())
@@ -284,28 +532,28 @@ class RegPath:
     # ==============================
 
     def flush(self):
-        self._invoke_api('FlushKey')
+        self._invoke_api(winreg.FlushKey)
 
     # ==============================
 
     def load_from(self, name: str, file: str):
-        self._invoke_api('LoadKey', name, file)
+        self._invoke_api(winreg.LoadKey, name, file)
 
     def save_to(self, file: str):
-        self._invoke_api('SaveKey', file)
+        self._invoke_api(winreg.SaveKey, file)
 
     # ==============================
 
     @property
     def reflection(self):
-        return bool(self._invoke_api('QueryReflectionKey'))
+        return bool(self._invoke_api(winreg.QueryReflectionKey))
 
     @reflection.setter
     def reflection(self, value):
         if value:
-            self._invoke_api('EnableReflectionKey')
+            self._invoke_api(winreg.EnableReflectionKey)
         else:
-            self._invoke_api('DisableReflectionKey')
+            self._invoke_api(winreg.DisableReflectionKey)
 
     # ==============================
     # =    Работа со значениями    =
@@ -333,30 +581,52 @@ class RegPath:
     # ==============================
 
     def keys(self):
-        return (k for k, v in self.items())
+        return (name for name, data, typ in self._enum_values())
 
     def values(self):
-        return (v for k, v in self.items())
+        return (data for name, data, typ in self._enum_values())
 
     def to_dict(self):
-        return dict(self.items())
+        return {name: data for name, data, typ in self._enum_values()}
 
     # ==============================
 
     def set_value(self, name: typing.Optional[str], value, typ=None):
-        self._invoke_api('SetValueEx', name, 0, _normalize_type(typ, value), value)
+        self.open()
+        _SetValueEx(self.key, name, 0, _normalize_type(typ, value), value)
+
+    # Typed setters skip type inference
+    def set_value_str(self, name: typing.Optional[str], value: str):
+        self.open()
+        _SetValueEx(self.key, name, 0, _REG_SZ, value)
+
+    def set_value_dword(self, name: typing.Optional[str], value: int):
+        self.open()
+        _SetValueEx(self.key, name, 0, _REG_DWORD, value)
+
+    def set_value_qword(self, name: typing.Optional[str], value: int):
+        self.open()
+        _SetValueEx(self.key, name, 0, _REG_QWORD, value)
+
+    def set_value_multi(self, name: typing.Optional[str], values: typing.List[str]):
+        self.open()
+        _SetValueEx(self.key, name, 0, _REG_MULTI_SZ, values)
 
     def get_value(self, name: typing.Optional[str]):
-        return self._invoke_api('QueryValueEx', name)[0]
+        self.open()
+        return _QueryValueEx(self.key, name)[0]
 
     def delete_value(self, name: str):
-        self._invoke_api('DeleteValue', name)
+        self.open()
+        _DeleteValue(self.key, name)
 
     def items(self):
-        cc, vc, lm = self._invoke_api('QueryInfoKey')
-        for i in range(vc):
-            name, data, typ = self._invoke_api('EnumValue', i)
-            yield name, data
+        return ((name, data) for name, data, typ in self._enum_values())
+
+    def _enum_values(self):
+        self.open()
+        cc, vc, lm = _QueryInfoKey(self.key)
+        return _list_values(self.key, vc)
 
 
 _HIVES = {
@@ -380,11 +650,17 @@ HK_ALIASES = {
     'HKPD': 'HKEY_PERFORMANCE_DATA',
 }
 
+_HIVE_CANON = {**{k: k for k in _HIVES}, **HK_ALIASES}
+
+# Hives are created before any alias is registered: each local hive is its own `hive`
 HIVES = {}
-HKEY_CLASSES_ROOT = HKCR = HIVES['HKEY_CLASSES_ROOT'] = HIVES['HKCR'] = RegPath('HKEY_CLASSES_ROOT')
-HKEY_CURRENT_CONFIG = HKCC = HIVES['HKEY_CURRENT_CONFIG'] = HIVES['HKCC'] = RegPath('HKEY_CURRENT_CONFIG')
-HKEY_CURRENT_USER = HKCU = HIVES['HKEY_CURRENT_USER'] = HIVES['HKCU'] = RegPath('HKEY_CURRENT_USER')
-HKEY_LOCAL_MACHINE = HKLM = HIVES['HKEY_LOCAL_MACHINE'] = HIVES['HKLM'] = RegPath('HKEY_LOCAL_MACHINE')
-HKEY_USERS = HKU = HIVES['HKEY_USERS'] = HIVES['HKU'] = RegPath('HKEY_USERS')
-HKEY_DYN_DATA = HKDD = HIVES['HKEY_DYN_DATA'] = HIVES['HKDD'] = RegPath('HKEY_DYN_DATA')
-HKEY_PERFORMANCE_DATA = HKPD = HIVES['HKEY_PERFORMANCE_DATA'] = HIVES['HKPD'] = RegPath('HKEY_PERFORMANCE_DATA')
+HIVES.update({name: RegPath(name) for name in _HIVES})
+HIVES.update({alias: HIVES[name] for alias, name in HK_ALIASES.items()})
+
+HKEY_CLASSES_ROOT = HKCR = HIVES['HKEY_CLASSES_ROOT']
+HKEY_CURRENT_CONFIG = HKCC = HIVES['HKEY_CURRENT_CONFIG']
+HKEY_CURRENT_USER = HKCU = HIVES['HKEY_CURRENT_USER']
+HKEY_LOCAL_MACHINE = HKLM = HIVES['HKEY_LOCAL_MACHINE']
+HKEY_USERS = HKU = HIVES['HKEY_USERS']
+HKEY_DYN_DATA = HKDD = HIVES['HKEY_DYN_DATA']
+HKEY_PERFORMANCE_DATA = HKPD = HIVES['HKEY_PERFORMANCE_DATA']